@@ -1,10 +1,18 @@
+import argparse
 import json
 import re
 import logging
+import string
+import zipfile
+from collections import namedtuple
+from functools import lru_cache
+from html.parser import HTMLParser
 from pathlib import Path
 from datetime import datetime
+from urllib.parse import urlparse, parse_qs
 import yaml
 import requests
+from requests.adapters import HTTPAdapter
 from packaging.version import parse as parse_version, InvalidVersion
 from jinja2 import Environment, FileSystemLoader
 from selenium import webdriver
@@ -67,19 +75,108 @@ def normalize_version_string(v_str):
     return f"{v_str}.x"
   return v_str
 
-def is_url_valid(url, timeout=10):
+HTTP_HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+
+def get_tid_from_url(url):
+  """Returns the tid query parameter of a TRM ToolPage URL, or an empty string."""
+  return parse_qs(urlparse(url).query).get("tid", [""])[0]
+
+
+def is_valid_response(status_code, text):
+  """Returns True if a ToolPage response is a real entry rather than an error page."""
+  if status_code != 200:
+    return False
+  if "The Entry you are looking for is invalid" in text:
+    return False
+  return True
+
+
+@lru_cache(maxsize=None)
+def enable_http2():
+  """
+  Switches urllib3 to its experimental HTTP/2 support, at most once per process.
+  This patches every urllib3 HTTPS connection in the process, not just the scan's
+  session, and is never undone. Returns False if the optional 'h2' package is missing.
+  """
+  try:
+    import urllib3.http2  # pylint: disable=import-outside-toplevel
+    urllib3.http2.inject_into_urllib3()
+    return True
+  except ImportError as e:
+    logging.warning("HTTP/2 unavailable, using HTTP/1.1 (install 'h2' to enable): %s", e)
+    return False
+
+
+def create_http_session(http_config=None):
+  """
+  Builds the keep-alive session shared by every TRM request in a scan.
+  Reads pool sizes, proxies, CA bundle and HTTP/2 settings from the 'http' config section.
+  Enabling http2 affects all HTTPS connections made through urllib3 in this process.
+  """
+  http_config = http_config or {}
+  session = requests.Session()
+  session.headers.update(HTTP_HEADERS)
+
+  if http_config.get("http2"):
+    enable_http2()
+
+  adapter = HTTPAdapter(
+    pool_connections=http_config.get("pool_connections", 1),
+    pool_maxsize=http_config.get("pool_maxsize", 4)
+  )
+  session.mount("https://", adapter)
+  session.mount("http://", adapter)
+
+  session.proxies.update(http_config.get("proxies") or {})
+  if "verify" in http_config:
+    session.verify = http_config["verify"]
+  return session
+
+
+def get_pool_stats(session):
+  """
+  Summarizes connection reuse across the session's pools.
+  Every new HTTPS connection costs one TLS handshake.
+  Returns a dictionary of request, connection and handshake counts plus the reuse ratio.
+  """
+  stats = {"requests": 0, "connections": 0, "handshakes": 0}
+  for adapter in set(session.adapters.values()):
+    pools = adapter.poolmanager.pools
+    for key in pools.keys():
+      pool = pools[key]
+      stats["requests"] += pool.num_requests
+      stats["connections"] += pool.num_connections
+      if pool.scheme == "https":
+        stats["handshakes"] += pool.num_connections
+
+  reused = stats["requests"] - stats["connections"]
+  stats["reuse_ratio"] = round(reused / stats["requests"], 3) if stats["requests"] else 0.0
+  return stats
+
+
+def is_url_valid(url, timeout=10, archive=None, session=None):
   """
   Checks if the given TRM URL is reachable and not flagged as invalid.
+  Uses the shared session when given so connections are reused across TIDs.
+  Records the response to the archive, or reads it back when replaying.
   Returns True if valid, False otherwise.
   """
-  headers = {"User-Agent": "Mozilla/5.0"}
-  try:
-    response = requests.get(url, headers=headers, timeout=timeout)
-    if response.status_code != 200:
-      return False
-    if "The Entry you are looking for is invalid" in response.text:
+  if archive and archive.replay:
+    record = archive.load(get_tid_from_url(url), "check")
+    if record is None:
+      logging.warning("No recorded URL check for %s in %s", url, archive.path)
       return False
-    return True
+    return is_valid_response(record["status_code"], record["text"])
+
+  try:
+    if session:
+      response = session.get(url, timeout=timeout)
+    else:
+      response = requests.get(url, headers=HTTP_HEADERS, timeout=timeout)
+    if archive:
+      archive.record(get_tid_from_url(url), "check", url, response.text, response.status_code)
+    return is_valid_response(response.status_code, response.text)
   except requests.RequestException as e:
     logging.warning("URL check failed for %s: %s", url, e)
     return False
@@ -89,21 +186,288 @@ TABLE_XPATH = "//table[.//th[contains(text(), 'CY')]]"
 
 DECISION_NOT_FOUND = "Decision Not Found"
 INVALID_LINK_DECISION = "Unapproved (Invalid Link)"
+NOT_RECORDED = "Not Recorded"
 
 CURR_YEAR, CURR_QUARTER = get_current_quarter()
 QUARTER_MAP = generate_quarter_map(CURR_YEAR)
 
+DEFAULT_ARCHIVE_PATH = "trm_archive.zip"
+ARCHIVE_TIME_FORMAT = "%Y%m%dT%H%M%S%f"
+ARCHIVE_MEMBER_PATTERN = re.compile(r"^([^/]+)/([^/]+)/(check|page)\.json$")
+
+# === Scan Archive ===
+class ScanArchive:
+  """
+  Compressed zip archive of raw ToolPage responses from a scan.
+  Members are stored as '<tid>/<fetch time>/<kind>.json', where kind is 'check'
+  for the HTTP validity response and 'page' for the page loaded in the browser.
+  The fetch time identifies the scan, so every tid of a scan shares it.
+  Scans append to the same archive; replay reads every tid from a single scan,
+  the newest one unless replay_at names another.
+  Recording is best-effort: the first failure is logged and recording stops,
+  so an unwritable archive never affects the scan itself.
+  """
+
+  def __init__(self, path, replay=False, replay_at=None):
+    self.path = Path(path)
+    self.replay = replay
+    self.recording = not replay
+    self.fetched_at = datetime.now().strftime(ARCHIVE_TIME_FORMAT)
+    self.scans = {}
+    self.zip_file = None
+    if replay:
+      self.zip_file = zipfile.ZipFile(self.path, "r")  # pylint: disable=consider-using-with
+      self.load_index()
+      if not self.scans:
+        self.close()
+        raise ValueError(f"No recorded scans in {self.path}")
+      if replay_at is not None and replay_at not in self.scans:
+        self.close()
+        available = ", ".join(sorted(self.scans))
+        raise ValueError(f"No scan recorded at {replay_at} in {self.path}, available: {available}")
+      self.fetched_at = replay_at or max(self.scans)
+
+  def load_index(self):
+    """
+    Indexes the archive members as {fetch time: {tid: {kinds}}}.
+    Members not named '<tid>/<fetch time>/<kind>.json' are skipped with a warning.
+    """
+    skipped = []
+    for member in self.zip_file.namelist():
+      match = ARCHIVE_MEMBER_PATTERN.match(member)
+      if not match:
+        skipped.append(member)
+        continue
+      tid, fetched_at, kind = match.groups()
+      self.scans.setdefault(fetched_at, {}).setdefault(tid, set()).add(kind)
+    if skipped:
+      logging.warning("Skipping %s members of %s not named <tid>/<fetch time>/<kind>.json: %s",
+                      len(skipped), self.path, ", ".join(skipped))
+
+  def record(self, tid, kind, url, text, status_code=None):
+    """Stores one response for the tid under this scan's fetch time."""
+    if not self.recording:
+      return
+    try:
+      self.write_record(tid, kind, {"url": url, "status_code": status_code, "text": text})
+    except (OSError, zipfile.BadZipFile, ValueError) as e:
+      logging.error("Recording to %s failed, recording disabled for this scan: %s", self.path, e)
+      self.recording = False
+      try:
+        self.close()
+      except (OSError, zipfile.BadZipFile, ValueError):
+        self.zip_file = None
+
+  def write_record(self, tid, kind, payload):
+    """Opens the archive on first use and writes one member, skipping duplicates within the scan."""
+    if self.zip_file is None:
+      # Opened lazily so runs that record nothing leave no archive behind
+      self.zip_file = zipfile.ZipFile(  # pylint: disable=consider-using-with
+        self.path, "a", compression=zipfile.ZIP_DEFLATED)
+      self.load_index()
+      # Never reuse the fetch time of a scan already in the archive
+      base, suffix = self.fetched_at, 0
+      while self.fetched_at in self.scans:
+        suffix += 1
+        self.fetched_at = f"{base}-{suffix}"
+
+    kinds = self.scans.setdefault(self.fetched_at, {}).setdefault(str(tid), set())
+    if kind in kinds:
+      return
+    payload["fetched_at"] = self.fetched_at
+    self.zip_file.writestr(f"{tid}/{self.fetched_at}/{kind}.json", json.dumps(payload))
+    kinds.add(kind)
+
+  def is_recorded(self, tid):
+    """Returns True if the replayed scan holds any response for the tid."""
+    return str(tid) in self.scans.get(self.fetched_at, {})
+
+  def quarter(self):
+    """Returns the calendar year and quarter the scan was fetched in."""
+    fetched = datetime.strptime(self.fetched_at[:8], "%Y%m%d")
+    return fetched.year, f"Q{(fetched.month - 1) // 3 + 1}"
+
+  def load(self, tid, kind):
+    """Returns the tid's recorded response from the replayed scan, or None."""
+    if kind not in self.scans.get(self.fetched_at, {}).get(str(tid), ()):
+      return None
+    return json.loads(self.zip_file.read(f"{tid}/{self.fetched_at}/{kind}.json"))
+
+  def close(self):
+    """Flushes and closes the underlying zip file."""
+    if self.zip_file is not None:
+      self.zip_file.close()
+      self.zip_file = None
+
+
+BLOCK_TAGS = {"address", "article", "div", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6",
+              "header", "li", "p", "section", "table", "tr", "ul", "ol"}
+CELL_TAGS = {"td", "th"}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "wbr"}
+HIDDEN_TAGS = {"head", "script", "style", "noscript"}
+
+
+class ReplayElement:
+  """
+  Minimal stand-in for a Selenium WebElement built from recorded HTML.
+  Supports only the lookups the scan functions perform.
+  """
+
+  def __init__(self, tag, attrs):
+    self.tag = tag
+    self.attrs = attrs
+    self.children = []
+
+  @property
+  def text(self):
+    """Returns visible text, one line per block element, like WebElement.text."""
+    parts = []
+    self.collect_text(parts)
+    lines = (" ".join(line.split()) for line in "".join(parts).split("\n"))
+    return "\n".join(line for line in lines if line)
+
+  def collect_text(self, parts):
+    """Appends the text of this element's children to parts."""
+    for child in self.children:
+      if isinstance(child, str):
+        parts.append(child)
+      elif child.tag == "br":
+        parts.append("\n")
+      elif child.tag not in HIDDEN_TAGS:
+        separator = "\n" if child.tag in BLOCK_TAGS else " " if child.tag in CELL_TAGS else ""
+        parts.append(separator)
+        child.collect_text(parts)
+        parts.append(separator)
+
+  def get_attribute(self, name):
+    """Returns the attribute value or None."""
+    return self.attrs.get(name)
+
+  def iter_descendants(self):
+    """Yields all descendant elements in document order."""
+    for child in self.children:
+      if isinstance(child, ReplayElement):
+        yield child
+        yield from child.iter_descendants()
+
+  def find_elements(self, by, value):
+    """Finds descendants by tag name, id, or the TRM quarter table XPath."""
+    if by == By.TAG_NAME:
+      return [el for el in self.iter_descendants() if el.tag == value.lower()]
+    if by == By.ID:
+      return [el for el in self.iter_descendants() if el.attrs.get("id") == value]
+    if by == By.XPATH and value == TABLE_XPATH:
+      return [
+        el for el in self.iter_descendants()
+        if el.tag == "table" and any("CY" in th.text for th in el.find_elements(By.TAG_NAME, "th"))
+      ]
+    raise ValueError(f"Unsupported replay locator: {by} {value}")
+
+  def find_element(self, by, value):
+    """Returns the first match or raises NoSuchElementException."""
+    matches = self.find_elements(by, value)
+    if not matches:
+      raise NoSuchElementException(f"No element found for {by} {value}")
+    return matches[0]
+
+
+class ReplayPageParser(HTMLParser):
+  """Builds a ReplayElement tree from a recorded page."""
+
+  def __init__(self):
+    super().__init__()
+    self.root = ReplayElement("document", {})
+    self.stack = [self.root]
+
+  def handle_starttag(self, tag, attrs):
+    element = ReplayElement(tag, {name: value or "" for name, value in attrs})
+    self.stack[-1].children.append(element)
+    if tag not in VOID_TAGS:
+      self.stack.append(element)
+
+  def handle_startendtag(self, tag, attrs):
+    self.stack[-1].children.append(ReplayElement(tag, {name: value or "" for name, value in attrs}))
+
+  def handle_endtag(self, tag):
+    # Close the nearest open matching tag, implicitly closing anything left open inside it
+    for i in range(len(self.stack) - 1, 0, -1):
+      if self.stack[i].tag == tag:
+        del self.stack[i:]
+        return
+
+  def handle_data(self, data):
+    self.stack[-1].children.append(data)
+
+
+class ReplayDriver:
+  """
+  Offline replacement for the Chrome driver that serves pages from a ScanArchive.
+  No network or browser is used.
+  """
+
+  def __init__(self, archive):
+    self.archive = archive
+    self.document = ReplayElement("document", {})
+
+  def get(self, url):
+    """Loads the recorded page for the URL's tid."""
+    record = self.archive.load(get_tid_from_url(url), "page")
+    if record is None:
+      raise WebDriverException(f"No recorded page for {url} in {self.archive.path}")
+    parser = ReplayPageParser()
+    parser.feed(record["text"])
+    parser.close()
+    self.document = parser.root
+    if not self.document.find_elements(By.XPATH, TABLE_XPATH):
+      raise TimeoutException(f"Recorded page for {url} has no quarter table")
+
+  @property
+  def title(self):
+    """Returns the recorded page title."""
+    titles = self.document.find_elements(By.TAG_NAME, "title")
+    return titles[0].text if titles else ""
+
+  def find_element(self, by, value):
+    """Finds an element in the recorded page."""
+    return self.document.find_element(by, value)
+
+  def find_elements(self, by, value):
+    """Finds elements in the recorded page."""
+    return self.document.find_elements(by, value)
+
+  def quit(self):
+    """Matches the WebDriver interface; there is no browser to close."""
+
+
+def get_scan_quarter(archive=None):
+  """
+  Returns the (year, quarter) whose TRM column applies to a scan:
+  the recorded scan's when replaying, otherwise the current one.
+  """
+  if archive and archive.replay:
+    return archive.quarter()
+  return CURR_YEAR, CURR_QUARTER
+
+
+def get_quarter_lookup(quarter=None):
+  """
+  Returns the table header and quarter map for a (year, quarter) tuple.
+  Defaults to the current quarter.
+  """
+  year, quarter_name = quarter or (CURR_YEAR, CURR_QUARTER)
+  quarter_map = QUARTER_MAP if year == CURR_YEAR else generate_quarter_map(year)
+  return f"CY{year} {quarter_name}", quarter_map
+
+
 # === Selenium-Based Functions ===
 def get_decision_date(driver):
   """
-  Extracts the decision date from the TRM page content using JavaScript.
+  Extracts the decision date from the TRM page's visible text.
   Returns a list split from the raw string or 'Not Found' if unavailable.
   """
   try:
-    script = (
-      "return document.body.innerText.match(/Decision Date \\((.*?)\\)/)?.[1] || 'Unknown';"
-    )
-    decision_text = driver.execute_script(script)
+    match = re.search(r"Decision Date \((.*?)\)", driver.find_element(By.TAG_NAME, "body").text)
+    decision_text = match.group(1) if match else "Unknown"
     if decision_text:
       return decision_text.split(" ")
 
@@ -114,13 +478,14 @@ def get_decision_date(driver):
     logging.warning("Element with decision date not found.")
     return "Not Found"
 
-def get_current_decision(driver, version):
+def get_current_decision(driver, version, quarter=None):
   """
   Locates the decision for a specific version within the TRM quarter table.
   Uses both original and normalized version values for flexibility.
+  quarter is a (year, quarter) tuple and defaults to the current quarter.
   Returns a tuple: (matched_version, decision).
   """
-  target_header = f"CY{CURR_YEAR} {CURR_QUARTER}"
+  target_header, quarter_map = get_quarter_lookup(quarter)
 
   table = driver.find_element(By.XPATH, TABLE_XPATH)
   rows = table.find_elements(By.TAG_NAME, "tr")
@@ -129,7 +494,7 @@ def get_current_decision(driver, version):
     logging.warning("Table does not have enough header rows.")
     return None, DECISION_NOT_FOUND
 
-  col_index = QUARTER_MAP.get(target_header)
+  col_index = quarter_map.get(target_header)
   if col_index is None:
     logging.warning("Couldn't find column for %s", target_header)
     return None, DECISION_NOT_FOUND
@@ -157,17 +522,18 @@ def get_current_decision(driver, version):
   return None, DECISION_NOT_FOUND
 
 
-def get_all_version_decisions(driver):
+def get_all_version_decisions(driver, quarter=None):
   """
   Scrapes all version-decision pairs from the TRM quarter table.
+  quarter is a (year, quarter) tuple and defaults to the current quarter.
   Returns a list of tuples (version, decision) for the active quarter column.
   """
-  target_header = f"CY{CURR_YEAR} {CURR_QUARTER}"
+  target_header, quarter_map = get_quarter_lookup(quarter)
 
   table = driver.find_element(By.XPATH, TABLE_XPATH)
   rows = table.find_elements(By.TAG_NAME, "tr")
 
-  col_index = QUARTER_MAP.get(target_header)
+  col_index = quarter_map.get(target_header)
   if col_index is None or len(rows) < 2:
     logging.warning("Couldn't find valid column or table rows.")
     return []
@@ -189,22 +555,170 @@ def get_all_version_decisions(driver):
   return version_map
 
 
-def check_decision_status(decision1, version1, decision2, version2):
+# === Decision Rules ===
+ParsedDecision = namedtuple(
+  "ParsedDecision",
+  ["text", "base", "qualifiers", "constraints", "authorized", "unapproved", "missing", "divest", "poam"]
+)
+
+CONSTRAINT_PATTERN = re.compile(r"\[([^\]]*)\]")
+QUALIFIER_PATTERN = re.compile(r"\(([^)]*)\)")
+BASE_PATTERN = re.compile(r"^[^(\[]*")
+
+DEFAULT_STATUS_RULES = [
+  {"status": "Unapproved", "when": {"missing": True}},
+  {"status": "Unapproved", "when": {"unapproved": True}},
+  {"status": "InDivest", "when": {"divest": True}},
+  {"status": "Unapproved", "when": {"version_match": False}},
+  {"status": "InCompliance", "when": {"decision_match": True}},
+  {"status": "Decision Mismatch (Constraints Added: {added})",
+   "when": {"base_match": True, "constraints": "added"}},
+  {"status": "Decision Mismatch (Constraints Removed: {removed})",
+   "when": {"base_match": True, "constraints": "removed"}},
+  {"status": "Decision Mismatch (Constraints Added: {added} Removed: {removed})",
+   "when": {"base_match": True, "constraints": "changed"}},
+  {"status": "Decision Mismatch (Was: {was} Now: {now})", "when": {}}
+]
+
+RULE_CONDITIONS = {
+  "missing": bool,
+  "unapproved": bool,
+  "divest": bool,
+  "poam": bool,
+  "version_match": bool,
+  "decision_match": bool,
+  "base_match": bool,
+  "constraints": ("same", "added", "removed", "changed")
+}
+
+STATUS_FIELDS = {"was", "now", "added", "removed"}
+
+
+@lru_cache(maxsize=None)
+def parse_decision(decision):
+  """
+  Parses a TRM decision string into its structured parts.
+  Example: 'Authorized w/ Constraints (DIVEST) [25, 33]' yields base
+  'Authorized w/ Constraints', qualifiers {'DIVEST'} and constraints {25, 33}.
+  Flags match case-sensitively, as the TRM writes them.
+  Results are cached since the same decision strings recur across entries.
+  """
+  text = " ".join((decision or "").split())
+  constraints = frozenset(
+    int(num)
+    for group in CONSTRAINT_PATTERN.findall(text)
+    for num in re.findall(r"\d+", group)
+  )
+  qualifiers = frozenset(q.strip() for q in QUALIFIER_PATTERN.findall(text))
+
+  return ParsedDecision(
+    text=text,
+    base=BASE_PATTERN.match(text).group(0).strip(),
+    qualifiers=qualifiers,
+    constraints=constraints,
+    authorized="Authorized" in text,
+    unapproved="Unapproved" in text,
+    missing=not text or DECISION_NOT_FOUND in text,
+    divest="DIVEST" in text,
+    poam="POA&M" in text
+  )
+
+
+def is_clean_authorization(decision):
+  """Returns True if the decision is Authorized without a DIVEST or POA&M flag."""
+  parsed = parse_decision(decision)
+  return parsed.authorized and not parsed.divest and not parsed.poam
+
+
+def needs_next_version(decision):
+  """Returns True if the scraped decision calls for finding a replacement version."""
+  parsed = parse_decision(decision)
+  return parsed.unapproved or parsed.missing or parsed.divest
+
+
+def compare_decisions(decision1, version1, decision2, version2):
+  """
+  Builds the facts a status rule can test for a stored vs. scraped decision.
+  Returns a tuple of (facts, template values).
+  """
+  stored = parse_decision(decision1)
+  scraped = parse_decision(decision2)
+
+  added = scraped.constraints - stored.constraints
+  removed = stored.constraints - scraped.constraints
+  if added and removed:
+    constraint_change = "changed"
+  elif added:
+    constraint_change = "added"
+  elif removed:
+    constraint_change = "removed"
+  else:
+    constraint_change = "same"
+
+  base_match = stored.base == scraped.base and stored.qualifiers == scraped.qualifiers
+  facts = {
+    "missing": scraped.missing,
+    "unapproved": scraped.unapproved,
+    "divest": scraped.divest,
+    "poam": scraped.poam,
+    "version_match": extract_numeric_version(version1) == extract_numeric_version(version2),
+    "decision_match": base_match and constraint_change == "same",
+    "base_match": base_match,
+    "constraints": constraint_change
+  }
+  values = {
+    "was": decision1,
+    "now": decision2,
+    "added": ", ".join(str(n) for n in sorted(added)),
+    "removed": ", ".join(str(n) for n in sorted(removed))
+  }
+  return facts, values
+
+
+def compile_status_rules(rules=None):
+  """
+  Validates declarative status rules and compiles them into an ordered list of
+  (conditions, status template) pairs. The first rule whose conditions all hold wins.
+  Raises ValueError for unknown conditions, values or status template fields.
+  """
+  compiled = []
+  for rule in rules if rules is not None else DEFAULT_STATUS_RULES:
+    if "status" not in rule:
+      raise ValueError(f"Status rule is missing 'status': {rule}")
+    for _, field, _, _ in string.Formatter().parse(rule["status"]):
+      if field is not None and field not in STATUS_FIELDS:
+        raise ValueError(f"Unknown field '{{{field}}}' in status '{rule['status']}', expected one of {STATUS_FIELDS}")
+    when = rule.get("when") or {}
+    if not isinstance(when, dict):
+      raise ValueError(f"Status rule 'when' must be a mapping of conditions, got {when!r}")
+    conditions = []
+    for key, expected in when.items():
+      allowed = RULE_CONDITIONS.get(key)
+      if allowed is None:
+        raise ValueError(f"Unknown status rule condition '{key}'")
+      if allowed is bool and not isinstance(expected, bool):
+        raise ValueError(f"Status rule condition '{key}' expects true or false, got {expected!r}")
+      if allowed is not bool and expected not in allowed:
+        raise ValueError(f"Status rule condition '{key}' expects one of {allowed}, got {expected!r}")
+      conditions.append((key, expected))
+    compiled.append((tuple(conditions), rule["status"]))
+  return compiled
+
+
+DEFAULT_STATUS_MATCHER = compile_status_rules()
+
+
+def check_decision_status(decision1, version1, decision2, version2, matcher=None):
   """
   Compares stored vs. scraped decision/version to determine status.
-  Returns status string: 'InCompliance', 'InDivest', 'Decision Mismatch', or 'Unapproved'.
-  """
-  v1 = extract_numeric_version(version1)
-  v2 = extract_numeric_version(version2)
-
-  if not decision2 or DECISION_NOT_FOUND in decision2 or "Unapproved" in decision2:
-    return "Unapproved"
-  if "DIVEST" in decision2:
-    return "InDivest"
-  if v1 == v2 and decision1 == decision2:
-    return "InCompliance"
-  if v1 == v2 and decision1 != decision2:
-    return f"Decision Mismatch (Was: {decision1} Now: {decision2})"
+  Returns status string: 'InCompliance', 'InDivest', 'Decision Mismatch (...)', or 'Unapproved'.
+  A compiled rule set from compile_status_rules can be passed as matcher.
+  """
+  facts, values = compare_decisions(decision1, version1, decision2, version2)
+
+  for conditions, status in matcher or DEFAULT_STATUS_MATCHER:
+    if all(facts[key] == expected for key, expected in conditions):
+      return status.format(**values)
   return "Unapproved"
 
 
@@ -224,7 +738,7 @@ def find_next_valid_version(current_version, version_map):
       continue
 
     # Only consider clean authorized versions
-    if "Authorized" in decision and "DIVEST" not in decision and "POA&M" not in decision:
+    if is_clean_authorization(decision):
       if original and parsed_version > original:
         candidates.append((parsed_version, version, decision))
       elif alt and parsed_version > alt:
@@ -234,7 +748,7 @@ def find_next_valid_version(current_version, version_map):
   if not candidates:
     for version, decision in version_map:
       parsed_version = extract_numeric_version(version)
-      if parsed_version and "Authorized" in decision and "DIVEST" not in decision and "POA&M" not in decision:
+      if parsed_version and is_clean_authorization(decision):
         candidates.append((parsed_version, version, decision))
 
   if candidates:
@@ -245,16 +759,19 @@ def find_next_valid_version(current_version, version_map):
 
 
 # === Data Collection ===
-def fetch_data(driver, url, version):
+def fetch_data(driver, url, version, archive=None):
   """
   Loads a TRM tool page and extracts core metadata for the specified version.
+  The loaded page is recorded to the archive when one is given outside replay.
   Returns a dictionary with details, or None if an error occurs.
   """
   try:
     driver.get(url)
     WebDriverWait(driver, 15).until(
-      EC.presence_of_element_located((By.XPATH, "//table[.//th[contains(text(), 'CY')]]"))
+      EC.presence_of_element_located((By.XPATH, TABLE_XPATH))
     )
+    if archive and not archive.replay:
+      archive.record(get_tid_from_url(url), "page", url, driver.page_source)
 
   except SessionNotCreatedException as e:
     logging.error("Failed to create session: %s", e)
@@ -271,7 +788,7 @@ def fetch_data(driver, url, version):
 
   try:
     decision_date = get_decision_date(driver)
-    matched_version, decision = get_current_decision(driver, version)
+    matched_version, decision = get_current_decision(driver, version, get_scan_quarter(archive))
     clean_decision = decision.replace("\n", " ") if decision else DECISION_NOT_FOUND
 
     return {
@@ -288,32 +805,45 @@ def fetch_data(driver, url, version):
     logging.error("Failed to obtain elements: %s", e)
     return None
 
-def process_entry(driver, base_url, tid, version, name, decision):
+def invalid_link_entry(url, name, tid, version):
+  """Returns the report entry for a TID whose tool page link is invalid."""
+  return {
+    "URL": url,
+    "Name": name,
+    "Tid": tid,
+    "Version": version,
+    "Decision": INVALID_LINK_DECISION,
+    "Status": "Unapproved",
+    "Next Approved Version": "None Found",
+    "Decision Date": "None"
+  }
+
+
+ScanContext = namedtuple("ScanContext", ["matcher", "archive", "session"], defaults=(None, None, None))
+
+
+def process_entry(driver, base_url, tid, version, name, decision, *, scan=None):
   """
   Validates and processes a TRM tool entry. If valid, compares decisions
   and finds next approved version if needed.
+  scan is a ScanContext holding the status matcher, archive and HTTP session shared by the run.
   Returns a populated entry dictionary or None.
   """
+  matcher, archive, session = scan or ScanContext()
   url = f"{base_url}?tid={tid}&tab=2"
-  if not is_url_valid(url):
-    return {
-      "URL": url,
-      "Name": name,
-      "Tid": tid,
-      "Version": version,
-      "Decision": INVALID_LINK_DECISION,
-      "Status": "Unapproved",
-      "Next Approved Version": "None Found",
-      "Decision Date": "None"
-    }
+  if archive and archive.replay and not archive.is_recorded(tid):
+    logging.warning("TID %s was not recorded in the scan fetched at %s", tid, archive.fetched_at)
+    return {**invalid_link_entry(url, name, tid, version), "Decision": NOT_RECORDED, "Status": NOT_RECORDED}
+  if not is_url_valid(url, archive=archive, session=session):
+    return invalid_link_entry(url, name, tid, version)
 
-  entry = fetch_data(driver, url, version)
+  entry = fetch_data(driver, url, version, archive)
   if not entry:
     return None
 
-  entry["Status"] = check_decision_status(decision, version, entry["Decision"], entry["Version"])
-  if any(flag in entry["Decision"] for flag in ["Unapproved", DECISION_NOT_FOUND, "DIVEST"]):
-    version_map = get_all_version_decisions(driver)
+  entry["Status"] = check_decision_status(decision, version, entry["Decision"], entry["Version"], matcher)
+  if needs_next_version(entry["Decision"]):
+    version_map = get_all_version_decisions(driver, get_scan_quarter(archive))
     next_version, next_decision = find_next_valid_version(version, version_map)
     entry["Next Approved Version"] = f"{next_version }\n {next_decision}" if next_version else "No Approved Version Found"
 
@@ -321,19 +851,29 @@ def process_entry(driver, base_url, tid, version, name, decision):
 
 
 # === Report Generation ===
-def generate_report():
+def create_driver(archive):
   """
-  Main logic for generating the TRM compliance report.
-  Loads data, runs extraction, and outputs both JSON and HTML.
+  Returns a ReplayDriver when replaying the archive, otherwise a headless Chrome driver.
   """
-  # Setup headless browser
+  if archive and archive.replay:
+    return ReplayDriver(archive)
+
   chrome_options = Options()
   chrome_options.add_argument("--headless")
   chrome_options.add_argument("--disable-gpu")
   chrome_options.add_argument("--disable-dev-shm-usage")
   chrome_options.accept_insecure_certs = True
-  driver = webdriver.Chrome(options=chrome_options)
+  return webdriver.Chrome(options=chrome_options)
 
+
+def generate_report(replay=False, archive_path=DEFAULT_ARCHIVE_PATH, replay_at=None, record=True):
+  """
+  Main logic for generating the TRM compliance report.
+  Loads data, runs extraction, and outputs both JSON and HTML.
+  Live scans record every ToolPage response to archive_path unless record=False;
+  with replay=True the responses of the scan fetched at replay_at (default: newest)
+  are read back instead, with no network or browser.
+  """
   # Load input YAML
   script_dir = Path(__file__).resolve().parent
   yaml_path = script_dir.parent.parent / "files" / "trm_usage.yml"
@@ -344,6 +884,20 @@ def generate_report():
   base_url = config.get("trm_base_url", "")
   entries = config.get("trm_entries", [])
 
+  # Validate config and open resources before starting the browser so a bad
+  # config cannot leave Chrome running
+  matcher = compile_status_rules(config.get("status_rules"))
+  archive = None
+  if replay or record:
+    try:
+      archive = ScanArchive(archive_path, replay=replay, replay_at=replay_at)
+    except (OSError, zipfile.BadZipFile, ValueError) as e:
+      logging.error("Cannot replay archive %s: %s", archive_path, e)
+      return
+  session = create_http_session(config.get("http"))
+  scan = ScanContext(matcher, archive, session)
+  driver = None
+
   # Build report structure
   report = {
     "trm_base_url": base_url,
@@ -351,18 +905,27 @@ def generate_report():
   }
 
   try:
+    driver = create_driver(archive)
     for entry in entries:
       tid = entry["tid"]
       version = entry["version"]
       name = entry["name"]
       decision = entry["decision"]
       try:
-        result = process_entry(driver, base_url, tid, version, name, decision)
+        result = process_entry(driver, base_url, tid, version, name, decision, scan=scan)
         report["trm_entries"].append(result)
       except Exception as e:
         logging.error("Error processing TID %s with version %s: %s", tid, version, e)
   finally:
-    driver.quit()
+    if driver is not None:
+      driver.quit()
+    if archive is not None:
+      archive.close()
+    # Pools are cleared on close, so read the statistics first
+    report["run_summary"] = {"http": get_pool_stats(session)}
+    session.close()
+
+  logging.info("HTTP pool statistics: %s", report["run_summary"]["http"])
 
   # Write JSON report
   with open("trm_report.json", "w", encoding="utf-8") as f_json:
@@ -379,4 +942,15 @@ def generate_report():
 
 # === Main Function ===
 if __name__ == "__main__":
-  generate_report()
+  arg_parser = argparse.ArgumentParser(description="Check TRM entries for compliance and write a report.")
+  arg_parser.add_argument("--replay", action="store_true",
+                          help="run against a recorded archive instead of the live TRM site")
+  arg_parser.add_argument("--archive", default=DEFAULT_ARCHIVE_PATH,
+                          help=f"archive of recorded ToolPage responses (default: {DEFAULT_ARCHIVE_PATH})")
+  arg_parser.add_argument("--replay-at", metavar="FETCH_TIME",
+                          help="replay the scan recorded at this fetch time (implies --replay; default: newest)")
+  arg_parser.add_argument("--no-record", action="store_true",
+                          help="do not record ToolPage responses during a live scan")
+  args = arg_parser.parse_args()
+  generate_report(replay=args.replay or args.replay_at is not None, archive_path=args.archive,
+                  replay_at=args.replay_at, record=not args.no_record)
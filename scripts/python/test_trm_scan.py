@@ -1,13 +1,20 @@
+import shutil
+import tempfile
+import threading
 import unittest
+import zipfile
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
 from unittest.mock import patch, MagicMock, Mock, mock_open
 from requests.exceptions import  Timeout, ConnectionError
-from selenium.webdriver import Chrome, ChromeOptions
 from selenium.common.exceptions import (
     WebDriverException,
     TimeoutException
 )
 from project import (
     check_decision_status,
+    compile_status_rules,
+    parse_decision,
     generate_quarter_map,
     get_current_quarter,
     fetch_data,
@@ -16,6 +23,12 @@ from project import (
     get_all_version_decisions,
     process_entry,
     generate_report,
+    ScanArchive,
+    ReplayDriver,
+    ScanContext,
+    NOT_RECORDED,
+    create_http_session,
+    get_pool_stats,
     INVALID_LINK_DECISION
     )
 
@@ -24,6 +37,28 @@ from project import (
 CURR_YEAR, CURR_QUARTER = get_current_quarter()
 QUARTER_MAP = generate_quarter_map(CURR_YEAR)
 
+TOOL_URL = "https://www.oit.va.gov/Services/TRM/ToolPage.aspx?tid=9952&tab=2"
+
+
+def build_tool_page(tid, rows, year=CURR_YEAR):
+  """
+  Builds a minimal ToolPage document with a decision table for the year's quarter map.
+  '{quarter}' in a decision is replaced with the column's quarter header.
+  """
+  quarter_map = generate_quarter_map(year)
+  header = "".join(f"<th>{quarter}</th>" for quarter in quarter_map)
+  body = "".join(
+    f"<tr><td>{version}</td>" + "".join(f"<td>{decision.replace('{quarter}', q)}</td>" for q in quarter_map) + "</tr>"
+    for version, decision in rows
+  )
+  return (
+    f"<html><head><title> Tool {tid} </title></head><body>"
+    f"<input type='hidden' id='ContentPlaceHolder1_hdnToolId' value='{tid}'>"
+    f"<p>Decision Date (02/05/2025 by TRM)</p>"
+    f"<table><tr><th>Version</th>{header}</tr><tr><th></th>{header}</tr>{body}</table>"
+    f"</body></html>"
+  )
+
 # === Helper Function Tests ===
 class TestTRMHelpers(unittest.TestCase):
   """Tests helper logic for decision status and quarter mapping."""
@@ -61,27 +96,81 @@ class TestTRMHelpers(unittest.TestCase):
     for case in blanks:
       self.assertEqual(check_decision_status(*case), "Unapproved")
 
+  def test_constraints_added(self):
+    result = check_decision_status(
+      "Authorized w/ Constraints [18, 20]", "8.x", "Authorized w/ Constraints [18, 20, 22]", "8.x")
+    self.assertEqual(result, "Decision Mismatch (Constraints Added: 22)")
+
+  def test_constraints_removed_and_changed(self):
+    removed = check_decision_status("Authorized [1, 2, 3]", "1.0", "Authorized [1, 3]", "1.0")
+    changed = check_decision_status("Authorized [1, 2]", "1.0", "Authorized [1, 4]", "1.0")
+    self.assertEqual(removed, "Decision Mismatch (Constraints Removed: 2)")
+    self.assertEqual(changed, "Decision Mismatch (Constraints Added: 4 Removed: 2)")
+
+  def test_equivalent_formatting_is_compliant(self):
+    result = check_decision_status(
+      "Authorized w/ Constraints [18,20]", "1.0", "Authorized  w/ Constraints [20, 18]", "1.0")
+    self.assertEqual(result, "InCompliance")
+
+  def test_parse_decision(self):
+    parsed = parse_decision("Authorized w/ Constraints (DIVEST) [25, 33, 34]")
+    self.assertEqual(parsed.base, "Authorized w/ Constraints")
+    self.assertEqual(parsed.constraints, frozenset({25, 33, 34}))
+    self.assertTrue(parsed.divest)
+    self.assertFalse(parsed.poam)
+
+  def test_flags_are_case_sensitive(self):
+    self.assertIn("Decision Mismatch", check_decision_status("Authorized", "1.0", "Divest", "1.0"))
+    self.assertFalse(parse_decision("Authorized (Poa&m)").poam)
+    self.assertFalse(parse_decision("unapproved").unapproved)
+
+  def test_custom_status_rules(self):
+    matcher = compile_status_rules([
+      {"status": "Needs Review", "when": {"poam": True}},
+      {"status": "InCompliance", "when": {"decision_match": True}}
+    ])
+    self.assertEqual(check_decision_status("Authorized", "1.0", "Authorized (POA&M)", "1.0", matcher), "Needs Review")
+    self.assertEqual(check_decision_status("Authorized", "1.0", "Authorized [1]", "1.0", matcher), "Unapproved")
+
+  def test_invalid_status_rules(self):
+    with self.assertRaises(ValueError):
+      compile_status_rules([{"status": "InCompliance", "when": {"colour": True}}])
+    with self.assertRaises(ValueError):
+      compile_status_rules([{"status": "InCompliance", "when": {"constraints": "grew"}}])
+    with self.assertRaises(ValueError):
+      compile_status_rules([{"status": "Review {foo}", "when": {}}])
+    with self.assertRaises(ValueError):
+      compile_status_rules([{"status": "InCompliance", "when": ["decision_match"]}])
+
   def test_quarter_map_contents(self):
     self.assertIn("CY2025 Q2", QUARTER_MAP)
     self.assertIn("CY2024 Q3", QUARTER_MAP)
     self.assertIn("CY2026 Q1", QUARTER_MAP)
 
-# === Selenium Integration Tests ===
+# === Recorded Page Tests ===
 class TestSeleniumFunctions(unittest.TestCase):
-  """Tests fetch logic and version compliance using live Chrome headless driver."""
+  """Tests fetch logic and version compliance against a recorded ToolPage archive."""
 
   @classmethod
   def setUpClass(cls):
-    options = ChromeOptions()
-    options.add_argument("--headless")
-    cls.driver = Chrome(options=options)
+    cls.tmp_dir = tempfile.mkdtemp()
+    cls.archive_path = Path(cls.tmp_dir) / "trm_archive.zip"
+    recorder = ScanArchive(cls.archive_path)
+    page = build_tool_page("9952", [("Linux 1.8", "Authorized w/ Constraints [1, 2]"), ("Linux 2.0", "Unapproved")])
+    recorder.record("9952", "check", TOOL_URL, page, 200)
+    recorder.record("9952", "page", TOOL_URL, page)
+    recorder.close()
+    cls.archive = ScanArchive(cls.archive_path, replay=True)
+    cls.driver = ReplayDriver(cls.archive)
 
   @classmethod
   def tearDownClass(cls):
     cls.driver.quit()
+    cls.archive.close()
+    shutil.rmtree(cls.tmp_dir)
 
   def test_valid_entry_fetch(self):
-    entry = fetch_data(self.driver, "https://www.oit.va.gov/Services/TRM/ToolPage.aspx?tid=9952&tab=2", "Linux 1.8")
+    entry = fetch_data(self.driver, TOOL_URL, "Linux 1.8")
     self.assertIsInstance(entry, dict)
     self.assertEqual(entry["Tid"], "9952")
     self.assertEqual(entry["Version"], "Linux 1.8")
@@ -89,9 +178,32 @@ class TestSeleniumFunctions(unittest.TestCase):
     self.assertIn("Decision", entry)
 
   def test_invalid_entry_fetch(self):
-    entry = fetch_data(self.driver, "https://www.oit.va.gov/Services/TRM/ToolPage.aspx?tid=9952&tab=2", "Win 21.x")
+    entry = fetch_data(self.driver, TOOL_URL, "Win 21.x")
     self.assertEqual(entry["Decision"], "Decision Not Found")
 
+  def test_replayed_entry_details(self):
+    entry = fetch_data(self.driver, TOOL_URL, "Linux 1.8")
+    self.assertEqual(entry["Name"], "Tool 9952")
+    self.assertEqual(entry["Decision"], "Authorized w/ Constraints [1, 2]")
+    self.assertEqual(entry["Decision Date"], "02/05/2025")
+
+  def test_replayed_process_entry(self):
+    result = process_entry(self.driver, "https://www.oit.va.gov/Services/TRM/ToolPage.aspx", "9952",
+                           "Linux 1.8", "Linux", "Authorized w/ Constraints [1]",
+                           scan=ScanContext(archive=self.archive))
+    self.assertEqual(result["Status"], "Decision Mismatch (Constraints Added: 2)")
+
+  def test_missing_recording(self):
+    self.assertFalse(is_url_valid(TOOL_URL.replace("9952", "1"), archive=self.archive))
+    self.assertIsNone(fetch_data(self.driver, TOOL_URL.replace("9952", "1"), "Linux 1.8"))
+
+  def test_unrecorded_tid_is_not_invalid_link(self):
+    result = process_entry(self.driver, "https://www.oit.va.gov/Services/TRM/ToolPage.aspx", "1",
+                           "Linux 1.8", "Linux", "Authorized", scan=ScanContext(archive=self.archive))
+    self.assertEqual(result["Decision"], NOT_RECORDED)
+    self.assertEqual(result["Status"], NOT_RECORDED)
+
+
   def test_version_parsing_and_fallback(self):
     result = find_next_valid_version("abc", [("2.0", "Authorized")])
     self.assertEqual(result, ("2.0", "Authorized"))
@@ -113,6 +225,100 @@ class TestSeleniumFunctions(unittest.TestCase):
     self.assertEqual(find_next_valid_version("1.0", version_map), (None, None))
 
 
+class TestScanArchive(unittest.TestCase):
+  """Tests how recorded scans are stored and selected for replay."""
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.archive_path = Path(self.tmp_dir) / "trm_archive.zip"
+    self.page = build_tool_page("9952", [("Linux 1.8", "Authorized")])
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def record_scan(self, fetched_at, with_page=True):
+    """Records one scan of tid 9952, optionally without the browser page."""
+    recorder = ScanArchive(self.archive_path)
+    recorder.fetched_at = fetched_at
+    recorder.record("9952", "check", TOOL_URL, self.page, 200)
+    if with_page:
+      recorder.record("9952", "page", TOOL_URL, self.page)
+    recorder.close()
+    return recorder.fetched_at
+
+  def test_replay_reads_one_scan(self):
+    self.record_scan("20261018T090000000000")
+    self.record_scan("20261019T090000000000", with_page=False)
+    archive = ScanArchive(self.archive_path, replay=True)
+    self.assertEqual(archive.fetched_at, "20261019T090000000000")
+    self.assertIsNotNone(archive.load("9952", "check"))
+    self.assertIsNone(archive.load("9952", "page"))
+    self.assertIsNone(fetch_data(ReplayDriver(archive), TOOL_URL, "Linux 1.8"))
+    archive.close()
+
+  def test_replay_at_selects_scan(self):
+    self.record_scan("20261018T090000000000")
+    self.record_scan("20261019T090000000000", with_page=False)
+    archive = ScanArchive(self.archive_path, replay=True, replay_at="20261018T090000000000")
+    self.assertIsNotNone(archive.load("9952", "page"))
+    archive.close()
+    with self.assertRaises(ValueError):
+      ScanArchive(self.archive_path, replay=True, replay_at="20200101T000000000000")
+
+  def test_replay_uses_recorded_quarter(self):
+    self.page = build_tool_page("9952", [("Linux 1.8", "Authorized ({quarter})")], year=2025)
+    self.record_scan("20251118T090000000000")
+    archive = ScanArchive(self.archive_path, replay=True)
+    self.assertEqual(archive.quarter(), (2025, "Q4"))
+    entry = fetch_data(ReplayDriver(archive), TOOL_URL, "Linux 1.8", archive)
+    self.assertEqual(entry["Decision"], "Authorized (CY2025 Q4)")
+    archive.close()
+
+  def test_same_fetch_time_is_not_reused(self):
+    first = self.record_scan("20261019T090000000000")
+    second = self.record_scan("20261019T090000000000")
+    self.assertNotEqual(first, second)
+    archive = ScanArchive(self.archive_path, replay=True)
+    self.assertEqual(archive.fetched_at, second)
+    self.assertEqual(len(archive.zip_file.namelist()), 4)
+    archive.close()
+
+  @patch("project.webdriver.Chrome")
+  @patch("project.logging.error")
+  def test_missing_archive_is_logged(self, mock_log, mock_chrome):
+    generate_report(replay=True, archive_path=Path(self.tmp_dir) / "missing.zip")
+    mock_log.assert_called_once()
+    mock_chrome.assert_not_called()
+
+  def test_unwritable_archive_does_not_break_scan(self):
+    archive = ScanArchive(Path(self.tmp_dir) / "missing_dir" / "trm_archive.zip")
+    with patch("project.requests.get", return_value=Mock(status_code=200, text="OK")), \
+         patch("project.logging.error") as mock_log:
+      self.assertTrue(is_url_valid(TOOL_URL, archive=archive))
+      self.assertTrue(is_url_valid(TOOL_URL.replace("9952", "1"), archive=archive))
+    mock_log.assert_called_once()
+    self.assertFalse(archive.recording)
+
+  def test_foreign_members_are_skipped(self):
+    self.record_scan("20261019T090000000000")
+    with zipfile.ZipFile(self.archive_path, "a") as zip_file:
+      zip_file.writestr("README.txt", "notes")
+    archive = ScanArchive(self.archive_path, replay=True)
+    self.assertIsNotNone(archive.load("9952", "page"))
+    archive.close()
+
+  @patch("project.ScanArchive")
+  @patch("project.process_entry", return_value={"Tid": 1, "Status": "InCompliance"})
+  @patch("project.webdriver.Chrome")
+  @patch("project.yaml.safe_load")
+  @patch("project.open", new_callable=mock_open)
+  def test_no_record(self, mock_open_fn, mock_yaml, mock_chrome, mock_process_entry, mock_archive):
+    mock_yaml.return_value = {"trm_entries": [{"tid": 1, "version": "1.0", "name": "A", "decision": "Authorized"}]}
+    generate_report(record=False)
+    mock_archive.assert_not_called()
+    self.assertIsNone(mock_process_entry.call_args.kwargs["scan"].archive)
+
+
 # === Exception Handling Tests ===
 class TestFetchDataExceptions(unittest.TestCase):
   """Tests error handling during fetch_data execution."""
@@ -169,6 +375,64 @@ class TestIsUrlValid(unittest.TestCase):
     mock_get.side_effect = Timeout("Request timed out")
     self.assertFalse(is_url_valid("http://example.com"))
 
+  @patch("project.requests.get")
+  def test_shared_session(self, mock_get):
+    session = Mock()
+    session.get.return_value = Mock(status_code=200, text="OK")
+    self.assertTrue(is_url_valid("http://example.com", session=session))
+    session.get.assert_called_once_with("http://example.com", timeout=10)
+    mock_get.assert_not_called()
+
+# === HTTP Session Tests ===
+class KeepAliveHandler(BaseHTTPRequestHandler):
+  """Serves a small ToolPage body over a persistent HTTP/1.1 connection."""
+  protocol_version = "HTTP/1.1"
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    body = b"OK"
+    self.send_response(200)
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):  # pylint: disable=arguments-differ
+    pass
+
+
+class TestHttpSession(unittest.TestCase):
+  """Tests the shared session configuration and pool statistics."""
+
+  def test_config_settings(self):
+    session = create_http_session({
+      "pool_maxsize": 8,
+      "proxies": {"https": "http://proxy.example.com:8080"},
+      "verify": "/etc/ssl/certs/va-ca.pem"
+    })
+    self.assertEqual(session.get_adapter("https://example.com").poolmanager.connection_pool_kw["maxsize"], 8)
+    self.assertEqual(session.proxies["https"], "http://proxy.example.com:8080")
+    self.assertEqual(session.verify, "/etc/ssl/certs/va-ca.pem")
+    self.assertEqual(get_pool_stats(session), {"requests": 0, "connections": 0, "handshakes": 0, "reuse_ratio": 0.0})
+
+  def test_connections_are_reused(self):
+    server = HTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+      session = create_http_session()
+      url = f"http://127.0.0.1:{server.server_port}/ToolPage.aspx"
+      for tid in range(3):
+        self.assertTrue(is_url_valid(f"{url}?tid={tid}&tab=2", session=session))
+      stats = get_pool_stats(session)
+      session.close()
+    finally:
+      server.shutdown()
+      server.server_close()
+
+    self.assertEqual(stats["requests"], 3)
+    self.assertEqual(stats["connections"], 1)
+    self.assertEqual(stats["handshakes"], 0)
+    self.assertEqual(stats["reuse_ratio"], 0.667)
+
 # === Quarter Map Parsing Tests ===
 class TestGetAllVersionDecisions(unittest.TestCase):
   """Tests parsing version decisions from TRM tables."""
@@ -260,6 +524,15 @@ class TestGenerateReport(unittest.TestCase):
     mock_open_fn.assert_any_call("trm_report.html", "w", encoding="utf-8")
     mock_process_entry.assert_called_once()
 
+  @patch("project.webdriver.Chrome")
+  @patch("project.yaml.safe_load")
+  @patch("project.open", new_callable=mock_open)
+  def test_invalid_rules_do_not_start_browser(self, mock_open_fn, mock_yaml, mock_chrome):
+    mock_yaml.return_value = {"trm_entries": [], "status_rules": [{"status": "Review {foo}"}]}
+    with self.assertRaises(ValueError):
+      generate_report()
+    mock_chrome.assert_not_called()
+
 # === Entry Processing Tests ===
 class TestProcessEntry(unittest.TestCase):
   """Validates the behavior of processing TRM tool entries."""